@@ -0,0 +1 @@
+GIT_REVISION = None
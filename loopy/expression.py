@@ -29,6 +29,7 @@ from pymbolic.mapper import RecursiveMapper
 
 from loopy.codegen import Unvectorizable
 from loopy.diagnostic import LoopyError
+from loopy.types import NumpyType
 
 
 # type_context may be:
@@ -37,18 +38,26 @@ from loopy.diagnostic import LoopyError
 # - 'd' for double-precision floating point
 # or None for 'no known context'.
 
-def dtype_to_type_context(target, dtype):
-    from loopy.types import NumpyType
+_NUMPY_DTYPE_TO_TYPE_CONTEXT = {
+        np.dtype(np.float64): 'd',
+        np.dtype(np.complex128): 'd',
+        np.dtype(np.float32): 'f',
+        np.dtype(np.complex64): 'f',
+        }
+
 
+def dtype_to_type_context(target, dtype):
     if dtype.is_integral():
         return 'i'
-    if isinstance(dtype, NumpyType) and dtype.dtype in [np.float64, np.complex128]:
-        return 'd'
-    if isinstance(dtype, NumpyType) and dtype.dtype in [np.float32, np.complex64]:
-        return 'f'
+    if isinstance(dtype, NumpyType):
+        type_context = _NUMPY_DTYPE_TO_TYPE_CONTEXT.get(dtype.dtype)
+        if type_context is not None:
+            return type_context
     if target.is_vector_dtype(dtype):
-        return dtype_to_type_context(
-                target, NumpyType(dtype.numpy_dtype.fields["x"][0]))
+        element_dtype = dtype.numpy_dtype.fields["x"][0]
+        if element_dtype.kind in "iu":
+            return 'i'
+        return _NUMPY_DTYPE_TO_TYPE_CONTEXT.get(element_dtype)
 
     return None
 
@@ -410,6 +410,7 @@ class LoopKernel(ImmutableRecordWithoutPickling):
                 _cached_written_variables=_cached_written_variables)
 
         self._kernel_executor_cache = {}
+        self._type_inference_caches = {}
 
     # }}}
 
@@ -1506,6 +1507,7 @@ class LoopKernel(ImmutableRecordWithoutPickling):
         from loopy.kernel.tools import SetOperationCacheManager
         self.cache_manager = SetOperationCacheManager()
         self._kernel_executor_cache = {}
+        self._type_inference_caches = {}
 
     # }}}
 
@@ -23,12 +23,15 @@ THE SOFTWARE.
 """
 
 import six
+import struct
+from functools import reduce
 
 from pymbolic.mapper import CombineMapper
 import numpy as np
 
 from loopy.tools import is_integer
 from loopy.types import NumpyType
+from loopy.kernel.data import TemporaryVariable, KernelArgument, auto
 
 from loopy.diagnostic import (
         LoopyError,
@@ -44,8 +47,155 @@ def _debug(kernel, s, *args):
         logger.debug("%s: %s" % (kernel.name, logstr))
 
 
+# {{{ dtype promotion
+
+_INT32_MIN = -2**31
+_INT32_MAX = 2**31 - 1
+_INT64_MIN = -2**63
+_INT64_MAX = 2**63 - 1
+
+_DTYPE_INT32 = np.dtype(np.int32)
+_DTYPE_INT64 = np.dtype(np.int64)
+_DTYPE_FLOAT32 = np.dtype(np.float32)
+_DTYPE_FLOAT64 = np.dtype(np.float64)
+_DTYPE_COMPLEX64 = np.dtype(np.complex64)
+
+# Target-less :class:`loopy.types.NumpyType` instances for the types that
+# type inference produces most often. These are shared so that the mapper does
+# not need to create a new wrapper for each result, and so that equal results
+# are usually identical.
+_DTYPE_POOL = dict(
+        (np.dtype(tp), NumpyType(np.dtype(tp)))
+        for tp in [np.int32, np.int64, np.float32, np.float64,
+            np.complex64, np.complex128])
+
+
+def intern_dtype(dtype):
+    """Return a target-less :class:`loopy.types.NumpyType` for the
+    :class:`numpy.dtype` *dtype*, shared with other callers if *dtype*
+    is one of the commonly occurring types.
+    """
+    try:
+        return _DTYPE_POOL[dtype]
+    except KeyError:
+        return NumpyType(dtype)
+
+
+def _promote_types(numpy_dtypes):
+    """Return the :class:`numpy.dtype` resulting from an arithmetic operation
+    on (native, i.e. non-struct) *numpy_dtypes*, folding them pairwise with
+    :func:`numpy.promote_types`.
+    """
+    # np.promote_types only looks at the dtypes (no value-based casting,
+    # no allocation) and is much cheaper than np.result_type.
+    result = reduce(np.promote_types, numpy_dtypes)
+
+    if result != _DTYPE_FLOAT32 and _DTYPE_INT32 in numpy_dtypes:
+        others = [dtype for dtype in numpy_dtypes if dtype != _DTYPE_INT32]
+        if others and reduce(np.promote_types, others) == _DTYPE_FLOAT32:
+            # numpy makes (int32, float32) a double. I disagree.
+            result = _DTYPE_FLOAT32
+
+    return result
+
+# }}}
+
+
+# {{{ constant type inference
+
+def _map_integer_constant(expr):
+    if _INT32_MIN <= expr <= _INT32_MAX:
+        return [_DTYPE_POOL[_DTYPE_INT32]]
+    if _INT64_MIN <= expr <= _INT64_MAX:
+        return [_DTYPE_POOL[_DTYPE_INT64]]
+
+    raise TypeInferenceFailure("integer constant '%s' too large" % expr)
+
+
+def _map_float_constant(expr):
+    # deduce the smaller type by default
+    return [_DTYPE_POOL[_DTYPE_FLOAT32]]
+
+
+_FLOAT32_PAIR = struct.Struct("ff")
+
+
+def _is_single_precision_complex(expr):
+    """Return whether converting the Python :class:`complex` *expr* to
+    :class:`numpy.complex64` is exact, without creating numpy scalars.
+    """
+    try:
+        real, imag = _FLOAT32_PAIR.unpack(_FLOAT32_PAIR.pack(expr.real, expr.imag))
+    except OverflowError:
+        return False
+
+    return real == expr.real and imag == expr.imag
+
+
+def _map_complex_constant(expr):
+    if _is_single_precision_complex(expr):
+        # (COMPLEX_GUESS_LOGIC)
+        # No precision is lost by 'guessing' single precision, use that.
+        # This at least covers simple cases like '1j'.
+        return [_DTYPE_POOL[_DTYPE_COMPLEX64]]
+
+    # Codegen for complex types depends on exactly correct types.
+    # Refuse temptation to guess.
+    raise TypeInferenceFailure("Complex constant '%s' needs to "
+            "be sized (i.e. as numpy.complex64/128) for type inference "
+            % expr)
+
+
+# Maps the type of (unsized) Python constants to the function inferring
+# their type, sparing the detour through :func:`numpy.asarray`.
+_PYTHON_CONSTANT_MAPPERS = dict(
+        [(tp, _map_integer_constant) for tp in six.integer_types + (bool,)]
+        + [
+            (float, _map_float_constant),
+            (complex, _map_complex_constant),
+            ])
+
+# }}}
+
+
 # {{{ type inference mapper
 
+# Maps (mapper class, expression type) to the name of the mapper method
+# handling the expression, or *None* if the generic dispatch is to be used.
+# Kept at module level, as mappers are typically short-lived.
+_MAPPER_METHOD_NAMES = {}
+
+
+class _TypeInferenceCaches(object):
+    """Memoized results of :class:`TypeInferenceMapper`, possibly shared
+    between several mappers for the same kernel.
+
+    .. attribute:: rec_cache
+
+        Maps id(expr) (plus any extra mapper arguments) to a tuple
+        ``(expr, result)``. *expr* is kept to ensure the id stays valid
+        for the lifetime of the cache.
+
+    .. attribute:: name_to_dtype_set
+
+        Maps variable names to their (resolved) dtype sets.
+
+    .. attribute:: mangled_functions
+
+        Maps ``(identifier, arg_dtypes)`` to the result of function mangling.
+
+    Results whose computation ran into a symbol of unknown type are not
+    cached, so that each mapper tracks those symbols in its own
+    :attr:`TypeInferenceMapper.symbols_with_unknown_types`.
+    """
+
+    def __init__(self):
+        self.rec_cache = {}
+
+        self.name_to_dtype_set = {}
+        self.mangled_functions = {}
+
+
 class TypeInferenceMapper(CombineMapper):
     def __init__(self, kernel, new_assignments=None):
         """
@@ -59,15 +209,41 @@ class TypeInferenceMapper(CombineMapper):
         if new_assignments is None:
             new_assignments = {}
         self.new_assignments = new_assignments
+
+        if kernel is not None and not new_assignments:
+            # Without new assignments, results only depend on the kernel.
+            # Share caches with other mappers of the same type for it.
+            try:
+                caches = kernel._type_inference_caches[type(self)]
+            except KeyError:
+                caches = _TypeInferenceCaches()
+                kernel._type_inference_caches[type(self)] = caches
+        else:
+            caches = _TypeInferenceCaches()
+
         self.symbols_with_unknown_types = set()
+        self._rec_cache = caches.rec_cache
+        self._name_to_dtype_set = caches.name_to_dtype_set
+        self._mangled_functions = caches.mangled_functions
+
+        # Maps the type of an expression to the bound mapper method handling
+        # it (see _MAPPER_METHOD_NAMES), avoiding per-node attribute lookups
+        # in the generic dispatch.
+        self._mapper_methods = {}
+
+        if kernel is not None:
+            # Kernels are immutable, so these may be looked up once.
+            self._all_inames = kernel.all_inames()
+            self._index_dtype = kernel.index_dtype
+
+        self._device_ast_builder = None
 
     def __call__(self, expr, return_tuple=False, return_dtype_set=False):
         kwargs = {}
         if return_tuple:
             kwargs["return_tuple"] = True
 
-        result = super(TypeInferenceMapper, self).__call__(
-                expr, **kwargs)
+        result = self.rec(expr, **kwargs)
 
         assert isinstance(result, list)
 
@@ -91,10 +267,97 @@ class TypeInferenceMapper(CombineMapper):
 
     # /!\ Introduce caches with care--numpy.float32(x) and numpy.float64(x)
     # are Python-equal (for many common constants such as integers).
+    # This is why the cache below is keyed on object identity, not on
+    # (Python) equality.
+
+    def rec(self, expr, *args, **kwargs):
+        key = id(expr)
+        if args or kwargs:
+            key = (key, args, tuple(sorted(six.iteritems(kwargs))))
+
+        try:
+            cached_expr, result = self._rec_cache[key]
+        except KeyError:
+            pass
+        else:
+            assert cached_expr is expr
+            return result
+
+        try:
+            method = self._mapper_methods[type(expr)]
+        except KeyError:
+            method = self._get_mapper_method(expr)
+
+        n_symbols_with_unknown_types = len(self.symbols_with_unknown_types)
+
+        if method is not None:
+            result = method(expr, *args, **kwargs)
+        else:
+            result = super(TypeInferenceMapper, self).rec(expr, *args, **kwargs)
+
+        if len(self.symbols_with_unknown_types) == n_symbols_with_unknown_types:
+            # Otherwise, a symbol of unknown type was encountered, which needs
+            # to be recorded by every mapper running into it.
+            self._rec_cache[key] = (expr, result)
+        return result
+
+    def _get_mapper_method(self, expr):
+        """Return the bound mapper method for *expr*, as found by the generic
+        :class:`pymbolic.mapper.Mapper` dispatch, and remember it for all
+        expressions of the same type. Return *None* if the generic dispatch
+        should be used instead.
+        """
+        key = type(self), type(expr)
+        try:
+            method_name = _MAPPER_METHOD_NAMES[key]
+        except KeyError:
+            method_name = self._get_mapper_method_name(expr)
+            _MAPPER_METHOD_NAMES[key] = method_name
+
+        if method_name is None:
+            method = None
+        else:
+            method = getattr(self, method_name)
+
+        self._mapper_methods[type(expr)] = method
+        return method
+
+    def _get_mapper_method_name(self, expr):
+        from pymbolic.primitives import Expression, VALID_CONSTANT_CLASSES
+
+        if isinstance(expr, Expression):
+            if not hasattr(self, expr.mapper_method):
+                # leave it to the generic dispatch to complain
+                return None
+            return expr.mapper_method
+        elif isinstance(expr, VALID_CONSTANT_CLASSES):
+            return "map_constant"
+        else:
+            return None
 
     def copy(self):
         return type(self)(self.kernel, self.new_assignments)
 
+    @property
+    def device_ast_builder(self):
+        if self._device_ast_builder is None:
+            self._device_ast_builder = \
+                    self.kernel.target.get_device_ast_builder()
+        return self._device_ast_builder
+
+    def mangle_symbol(self, name):
+        return self.kernel.mangle_symbol(self.device_ast_builder, name)
+
+    def mangle_function(self, identifier, arg_dtypes):
+        key = (identifier, arg_dtypes)
+        try:
+            return self._mangled_functions[key]
+        except KeyError:
+            result = self.kernel.mangle_function(identifier, arg_dtypes,
+                    ast_builder=self.device_ast_builder)
+            self._mangled_functions[key] = result
+            return result
+
     def with_assignments(self, names_to_vars):
         new_ass = self.new_assignments.copy()
         new_ass.update(names_to_vars)
@@ -124,6 +387,15 @@ class TypeInferenceMapper(CombineMapper):
                 for dtype_set in dtype_sets
                 for dtype in dtype_set]
 
+        if not dtypes:
+            return []
+
+        # Shortcut for the common case of all operands being of the very same
+        # (e.g. interned) type.
+        first_dtype = dtypes[0]
+        if all(dtype is first_dtype for dtype in dtypes):
+            return [first_dtype]
+
         if not all(isinstance(dtype, NumpyType) for dtype in dtypes):
             if not is_single_valued(dtypes):
                 raise TypeInferenceFailure(
@@ -134,57 +406,48 @@ class TypeInferenceMapper(CombineMapper):
 
         numpy_dtypes = [dtype.dtype for dtype in dtypes]
 
-        if not numpy_dtypes:
-            return []
-
         if is_single_valued(numpy_dtypes):
             return [dtypes[0]]
 
-        result = numpy_dtypes.pop()
-        while numpy_dtypes:
-            other = numpy_dtypes.pop()
-
-            if result.fields is None and other.fields is None:
-                if (result, other) in [
-                        (np.int32, np.float32), (np.float32, np.int32)]:
-                    # numpy makes this a double. I disagree.
-                    result = np.dtype(np.float32)
-                else:
-                    result = (
-                            np.empty(0, dtype=result)
-                            + np.empty(0, dtype=other)
-                            ).dtype
-
-            elif result.fields is None and other.fields is not None:
-                # assume the non-native type takes over
-                # (This is used for vector types.)
-                result = other
-            elif result.fields is not None and other.fields is None:
-                # assume the non-native type takes over
-                # (This is used for vector types.)
-                pass
-            else:
-                if result is not other:
+        struct_dtypes = [dtype for dtype in numpy_dtypes
+                if dtype.fields is not None]
+
+        if struct_dtypes:
+            # assume the non-native type takes over
+            # (This is used for vector types.)
+            result = struct_dtypes[0]
+            for other in struct_dtypes[1:]:
+                # Compare by value: struct dtypes need not be identical objects
+                # (e.g. after unpickling), and their 'num' is always that of
+                # numpy.void.
+                if result != other:
                     raise TypeInferenceFailure(
                             "nothing known about result of operation on "
                             "'%s' and '%s'" % (result, other))
+        else:
+            result = _promote_types(numpy_dtypes)
 
-        return [NumpyType(result)]
+        return [intern_dtype(result)]
 
     def map_sum(self, expr):
         dtype_sets = []
-        small_integer_dtype_sets = []
+        has_small_integers = False
+        all_integral = True
         for child in expr.children:
+            if is_integer(child) and -1024 < child < 1024:
+                # Small integer literals only take part in type promotion if
+                # all other operands are integers. Their type is always int32,
+                # see map_constant.
+                has_small_integers = True
+                continue
+
             dtype_set = self.rec(child)
-            if is_integer(child) and abs(child) < 1024:
-                small_integer_dtype_sets.append(dtype_set)
-            else:
-                dtype_sets.append(dtype_set)
+            dtype_sets.append(dtype_set)
+            if all_integral:
+                all_integral = all(dtype.is_integral() for dtype in dtype_set)
 
-        if all(dtype.is_integral()
-                for dtype_set in dtype_sets
-                for dtype in dtype_set):
-            dtype_sets.extend(small_integer_dtype_sets)
+        if has_small_integers and all_integral:
+            dtype_sets.append([_DTYPE_POOL[_DTYPE_INT32]])
 
         return self.combine(dtype_sets)
 
@@ -198,42 +461,33 @@ class TypeInferenceMapper(CombineMapper):
 
         if all(dtype.is_integral() for dtype in dtypes):
             # both integers
-            return [NumpyType(np.dtype(np.float64))]
+            return [_DTYPE_POOL[_DTYPE_FLOAT64]]
 
         else:
             return self.combine([n_dtype_set, d_dtype_set])
 
     def map_constant(self, expr):
-        if is_integer(expr):
-            for tp in [np.int32, np.int64]:
-                iinfo = np.iinfo(tp)
-                if iinfo.min <= expr <= iinfo.max:
-                    return [NumpyType(np.dtype(tp))]
+        try:
+            map_python_constant = _PYTHON_CONSTANT_MAPPERS[type(expr)]
+        except KeyError:
+            pass
+        else:
+            return map_python_constant(expr)
 
-            else:
-                raise TypeInferenceFailure("integer constant '%s' too large" % expr)
+        if is_integer(expr):
+            return _map_integer_constant(expr)
 
-        dt = np.asarray(expr).dtype
         if hasattr(expr, "dtype"):
-            return [NumpyType(expr.dtype)]
+            return [intern_dtype(expr.dtype)]
         elif isinstance(expr, np.number):
             # Numpy types are sized
-            return [NumpyType(np.dtype(type(expr)))]
-        elif dt.kind == "f":
-            # deduce the smaller type by default
-            return [NumpyType(np.dtype(np.float32))]
+            return [intern_dtype(np.dtype(type(expr)))]
+
+        dt = np.asarray(expr).dtype
+        if dt.kind == "f":
+            return _map_float_constant(expr)
         elif dt.kind == "c":
-            if np.complex64(expr) == np.complex128(expr):
-                # (COMPLEX_GUESS_LOGIC)
-                # No precision is lost by 'guessing' single precision, use that.
-                # This at least covers simple cases like '1j'.
-                return [NumpyType(np.dtype(np.complex64))]
-
-            # Codegen for complex types depends on exactly correct types.
-            # Refuse temptation to guess.
-            raise TypeInferenceFailure("Complex constant '%s' needs to "
-                    "be sized (i.e. as numpy.complex64/128) for type inference "
-                    % expr)
+            return _map_complex_constant(expr)
         else:
             raise TypeInferenceFailure("Cannot deduce type of constant '%s'" % expr)
 
@@ -257,7 +511,7 @@ class TypeInferenceMapper(CombineMapper):
             identifier = identifier.name
 
         if identifier in ["indexof", "indexof_vec"]:
-            return [self.kernel.index_dtype]
+            return [self._index_dtype]
 
         def none_if_empty(d):
             if d:
@@ -270,7 +524,7 @@ class TypeInferenceMapper(CombineMapper):
         if None in arg_dtypes:
             return []
 
-        mangle_result = self.kernel.mangle_function(identifier, arg_dtypes)
+        mangle_result = self.mangle_function(identifier, arg_dtypes)
         if return_tuple:
             if mangle_result is not None:
                 return [mangle_result.result_dtypes]
@@ -287,43 +541,51 @@ class TypeInferenceMapper(CombineMapper):
                 % (identifier, len(arg_dtypes)))
 
     def map_variable(self, expr):
-        if expr.name in self.kernel.all_inames():
-            return [self.kernel.index_dtype]
+        name = expr.name
+        try:
+            return self._name_to_dtype_set[name]
+        except KeyError:
+            pass
 
-        result = self.kernel.mangle_symbol(
-                self.kernel.target.get_device_ast_builder(),
-                expr.name)
+        result = self._resolve_variable_dtype_set(name)
+        if result:
+            self._name_to_dtype_set[name] = result
+        return result
+
+    def _resolve_variable_dtype_set(self, name):
+        if name in self._all_inames:
+            return [self._index_dtype]
+
+        result = self.mangle_symbol(name)
 
         if result is not None:
             result_dtype, _ = result
             return [result_dtype]
 
-        obj = self.new_assignments.get(expr.name)
+        obj = self.new_assignments.get(name)
 
         if obj is None:
-            obj = self.kernel.arg_dict.get(expr.name)
+            obj = self.kernel.arg_dict.get(name)
 
         if obj is None:
-            obj = self.kernel.temporary_variables.get(expr.name)
+            obj = self.kernel.temporary_variables.get(name)
 
         if obj is None:
             raise TypeInferenceFailure("name not known in type inference: %s"
-                    % expr.name)
+                    % name)
 
-        from loopy.kernel.data import TemporaryVariable, KernelArgument
-        import loopy as lp
         if isinstance(obj, (KernelArgument, TemporaryVariable)):
-            assert obj.dtype is not lp.auto
+            assert obj.dtype is not auto
             result = [obj.dtype]
             if result[0] is None:
-                self.symbols_with_unknown_types.add(expr.name)
+                self.symbols_with_unknown_types.add(name)
                 return []
             else:
                 return result
 
         else:
             raise RuntimeError("unexpected type inference "
-                    "object type for '%s'" % expr.name)
+                    "object type for '%s'" % name)
 
     map_tagged_variable = map_variable
 
@@ -347,22 +609,22 @@ class TypeInferenceMapper(CombineMapper):
                     % (expr.aggregate, expr.name, numpy_dtype))
 
         dtype = field[0]
-        return [NumpyType(dtype)]
+        return [intern_dtype(dtype)]
 
     def map_comparison(self, expr):
         # "bool" is unusable because OpenCL's bool has indeterminate memory
         # format.
-        return [NumpyType(np.dtype(np.int32))]
+        return [_DTYPE_POOL[_DTYPE_INT32]]
 
     map_logical_not = map_comparison
     map_logical_and = map_comparison
     map_logical_or = map_comparison
 
     def map_group_hw_index(self, expr, *args):
-        return [self.kernel.index_dtype]
+        return [self._index_dtype]
 
     def map_local_hw_index(self, expr, *args):
-        return [self.kernel.index_dtype]
+        return [self._index_dtype]
 
     def map_reduction(self, expr, return_tuple=False):
         """
@@ -551,8 +813,6 @@ def infer_unknown_types(kernel, expect_completion=False):
 
     # {{{ work on type inference queue
 
-    from loopy.kernel.data import TemporaryVariable, KernelArgument
-
     for var_chain in sccs:
         changed_during_last_queue_run = False
         queue = var_chain[:]
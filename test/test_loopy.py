@@ -2345,6 +2345,88 @@ def test_multi_argument_reduction_type_inference():
             == [(int32, int32)])
 
 
+def test_type_inference_cache_distinguishes_equal_constants():
+    from loopy.type_inference import TypeInferenceMapper
+    from loopy.types import to_loopy_type
+    from pymbolic.primitives import Sum
+
+    knl = lp.make_kernel("{[i]: 0<=i<10}", "")
+    t_inf_mapper = TypeInferenceMapper(knl)
+
+    expr_32 = Sum((1, np.float32(2)))
+    expr_64 = Sum((1, np.float64(2)))
+
+    # np.float32(2) == np.float64(2), but their types differ
+    assert expr_32 == expr_64
+
+    assert t_inf_mapper(expr_32) == to_loopy_type(np.float32)
+    assert t_inf_mapper._rec_cache[id(expr_32)][0] is expr_32
+
+    # served from the cache
+    assert t_inf_mapper(expr_32) == to_loopy_type(np.float32)
+
+    # equal, but distinct expression: must not hit the entry for expr_32
+    assert t_inf_mapper(expr_64) == to_loopy_type(np.float64)
+    assert t_inf_mapper(expr_32) == to_loopy_type(np.float32)
+
+
+def test_type_inference_combine_equal_struct_dtypes():
+    from loopy.type_inference import TypeInferenceMapper
+    from loopy.types import NumpyType
+
+    def make_struct_dtype():
+        return np.dtype([("x", np.float32), ("y", np.float32)])
+
+    dtype_a = make_struct_dtype()
+    dtype_b = make_struct_dtype()
+    assert dtype_a is not dtype_b
+
+    result, = TypeInferenceMapper.combine([
+        [NumpyType(dtype_a)],
+        [NumpyType(np.dtype(np.float32))],
+        [NumpyType(dtype_b)]])
+    assert result == NumpyType(dtype_a)
+
+
+def test_type_inference_caches_shared_per_kernel():
+    from loopy.type_inference import TypeInferenceMapper
+    from loopy.diagnostic import DependencyTypeInferenceFailure
+    from pymbolic import var
+
+    knl = lp.make_kernel(
+            "{[i]: 0<=i<10}",
+            "out[i] = a + b + c",
+            [
+                lp.GlobalArg("out", np.float32, shape=(10,)),
+                lp.TemporaryVariable("a", dtype=None, shape=()),
+                lp.TemporaryVariable("b", dtype=None, shape=()),
+                lp.TemporaryVariable("c", dtype=np.float32, shape=()),
+                ])
+
+    mapper_1 = TypeInferenceMapper(knl)
+    mapper_2 = TypeInferenceMapper(knl)
+    assert mapper_1._rec_cache is mapper_2._rec_cache
+
+    assert mapper_1(var("out")[var("i")]) == lp.to_loopy_type(np.float32)
+
+    knl_copy = knl.copy()
+    assert TypeInferenceMapper(knl_copy)._rec_cache is not mapper_1._rec_cache
+
+    # symbols of unknown type are reported per mapper
+    a, b, c = var("a"), var("b"), var("c")
+    for sym in [a, b, a]:
+        with pytest.raises(DependencyTypeInferenceFailure) as exc_info:
+            TypeInferenceMapper(knl)(sym)
+        assert str(exc_info.value) == sym.name
+
+    # ... also if the result's type is known
+    expr = a + c
+    for _ in range(2):
+        t_inf_mapper = TypeInferenceMapper(knl)
+        assert t_inf_mapper(expr) == lp.to_loopy_type(np.float32)
+        assert t_inf_mapper.symbols_with_unknown_types == set(["a"])
+
+
 def test_multi_argument_reduction_parsing():
     from loopy.symbolic import parse, Reduction
 